@@ -1,11 +1,15 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.figure import Figure
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
-import tempfile
-from difflib import get_close_matches
+from reportlab.lib.utils import ImageReader
+from rapidfuzz import process, fuzz
+from numba import njit
 
 # Page settings
 st.set_page_config(page_title="Smart Sales Analyzer", layout="centered")
@@ -14,126 +18,243 @@ st.title("📊 Smart Sales Analyzer")
 # File uploader
 upload_file = st.file_uploader("Upload your sales data (.csv or .xlsx)", type=["csv", "xlsx"])
 
+# Day labels in dt.weekday order (Monday=0)
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+# Rows of a per-category table sent to the browser by default
+MAX_TABLE_ROWS = 50
+
 # Smarter column name matcher
-def guess_column_name(columns, alias_list, field_name):
-    clean_names = [col.strip().lower() for col in columns]
+def guess_column_name(clean_names, columns, alias_list, field_name):
     for alias in alias_list:
-        match = get_close_matches(alias, clean_names, n=1, cutoff=0.6)
+        match = process.extractOne(alias, clean_names, scorer=fuzz.ratio, score_cutoff=60)
         if match:
-            idx = clean_names.index(match[0])
-            col = columns[idx]
+            col = columns[match[2]]
             st.success(f"✅ Matched '{field_name}' to column: `{col}`")
             return col
     return None
 
+# Cached file parsing (keyed on the uploaded bytes, so reruns skip re-parsing)
+@st.cache_data(show_spinner=False)
+def load_data(name: str, data: bytes) -> pd.DataFrame:
+    if name.endswith(".csv"):
+        try:
+            # Multithreaded Arrow parser; string columns come back Arrow-backed
+            df = pd.read_csv(BytesIO(data), engine="pyarrow", dtype_backend="pyarrow")
+        except pd.errors.ParserError:
+            # The Arrow parser rejects ragged rows (e.g. missing trailing fields); the
+            # default parser fills them with NaN and cleaning drops them later
+            df = pd.read_csv(BytesIO(data), dtype_backend="pyarrow")
+    else:
+        # Rust-backed xlsx reader; far faster than openpyxl on large sheets
+        df = pd.read_excel(BytesIO(data), engine="calamine")
+
+    # The Arrow parser keeps duplicate headers as-is; rename repeats to "Sales.1" etc.
+    # like the default parser, so df[col] always selects a single column
+    seen = {}
+    columns = []
+    for col in map(str, df.columns):
+        if col in seen:
+            seen[col] += 1
+            col = f"{col}.{seen[col]}"
+        seen.setdefault(col, 0)
+        columns.append(col)
+    df.columns = columns
+    return df
+
+# Per-category sum and row count in one compiled pass over the sales and code arrays
+@njit(cache=True)
+def group_sum(sales, codes, ngroups):
+    sums = np.zeros(ngroups)
+    counts = np.zeros(ngroups, dtype=np.int64)
+    for i in range(sales.size):
+        v = sales[i]
+        k = codes[i]
+        if k >= 0 and not np.isnan(v):
+            sums[k] += v
+            counts[k] += 1
+    return sums, counts
+
+# Cached cleaning + insights. Keyed on the upload itself rather than the parsed
+# frame: Streamlit only hashes a sample of large DataFrames, so an edited file
+# of the same shape could otherwise hit a stale entry.
+@st.cache_data(show_spinner=False)
+def clean_data(name: str, data: bytes, sales_col: str, category_col: str):
+    df = load_data(name, data)
+    # Coerce first so one mask covers missing and non-numeric sales as well as missing categories
+    sales = pd.to_numeric(df[sales_col], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    category = df[category_col].array
+    mask = ~np.isnan(sales) & ~category.isna()
+    # Only pay for the boolean-index copies when there is actually something to drop
+    if not mask.all():
+        sales = sales[mask]
+        category = category[mask]
+    df_clean = pd.DataFrame({
+        "Sales": sales,
+        # Small integer codes make the group-by keys cheap to hash
+        "Category": pd.Categorical(category),
+    })
+
+    # One pass for both per-category aggregates
+    categories = df_clean["Category"].cat.categories
+    codes = df_clean["Category"].cat.codes.to_numpy().astype(np.int32)
+    sums, counts = group_sum(df_clean["Sales"].to_numpy(), codes, len(categories))
+    grouped = pd.DataFrame(
+        {"sum": sums, "mean": sums / counts},
+        index=pd.Index(categories, name="Category"),
+    )
+    # Grand total from the per-category sums rather than another pass over every row
+    total_sales = grouped["sum"].sum()
+    return df_clean, total_sales, grouped
+
+# One long-lived Figure per chart, reused across reruns and sessions. Each has a
+# lock because two sessions may redraw the same chart at the same time.
+@st.cache_resource
+def chart_figures() -> dict:
+    figures = {}
+    for name in ("total", "avg", "payment", "day"):
+        fig = Figure()
+        figures[name] = (fig, fig.subplots(), Lock())
+    return figures
+
+# Chart rendering. Uses the object-oriented Figure API (no pyplot global state)
+# so several charts can be rasterized on worker threads at once.
+def render_chart(slot, series: pd.Series, kind: str, color: str, title: str) -> bytes:
+    fig, ax, lock = slot
+    with lock:
+        ax.clear()
+        if kind == "pie":
+            ax.pie(series, labels=series.index, autopct="%1.1f%%", startangle=140)
+            ax.axis("equal")
+        else:
+            series.plot(kind=kind, ax=ax, color=color)
+        if title:
+            ax.set_title(title)
+        buf = BytesIO()
+        fig.savefig(buf, format="png", bbox_inches="tight")
+    return buf.getvalue()
+
+# Render all charts in parallel; cached so reruns with the same data skip Matplotlib
+@st.cache_data(show_spinner=False)
+def render_charts(charts: dict) -> dict:
+    figures = chart_figures()
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = {name: pool.submit(render_chart, figures[name], *spec) for name, spec in charts.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+# === PDF Report ===
+# Cached on the report inputs, so reruns that don't change the data reuse the same bytes
+@st.cache_data(show_spinner=False)
+def build_pdf(total_sales, top_category, avg_items, chart_png: bytes) -> bytes:
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+    width, height = letter
+
+    c.setFont("Helvetica-Bold", 18)
+    c.drawString(50, height - 50, "Smart Sales Report")
+
+    c.setFont("Helvetica", 12)
+    c.drawString(50, height - 100, f"Total Sales: ₹{total_sales:,.2f}")
+    if top_category is not None:
+        c.drawString(50, height - 120, f"Top Category: {top_category}")
+    c.drawString(50, height - 140, "Average Sales per Category:")
+
+    y = height - 160
+    for cat, val in avg_items:
+        c.drawString(60, y, f"{cat}: ₹{val:,.2f}")
+        y -= 15
+
+    # Add chart to PDF straight from the in-memory PNG
+    c.drawImage(ImageReader(BytesIO(chart_png)), 50, 200, width=400, height=250)
+    c.showPage()
+    c.save()
+    return buffer.getvalue()
+
 # Main logic
 if upload_file is not None:
     try:
         # Read file
-        if upload_file.name.endswith(".csv"):
-            df = pd.read_csv(upload_file)
-        else:
-            df = pd.read_excel(upload_file)
+        df = load_data(upload_file.name, upload_file.getvalue())
 
         st.write("🧾 Detected Columns in File:")
         st.write(list(df.columns))
 
         # Match column names
-        sales_col = guess_column_name(df.columns, ["sales", "amount", "total", "revenue", "price"], "Sales")
-        category_col = guess_column_name(df.columns, ["category", "product", "item", "type", "name"], "Category")
-        date_col = guess_column_name(df.columns, ["date", "order date", "timestamp"], "Date")
-        payment_col = guess_column_name(df.columns, ["payment", "payment method", "method", "mode"], "Payment Method")
+        clean_names = [col.strip().lower() for col in df.columns]
+        sales_col = guess_column_name(clean_names, df.columns, ["sales", "amount", "total", "revenue", "price"], "Sales")
+        category_col = guess_column_name(clean_names, df.columns, ["category", "product", "item", "type", "name"], "Category")
+        date_col = guess_column_name(clean_names, df.columns, ["date", "order date", "timestamp"], "Date")
+        payment_col = guess_column_name(clean_names, df.columns, ["payment", "payment method", "method", "mode"], "Payment Method")
 
         if sales_col is None or category_col is None:
             st.error("❌ Could not detect 'Sales' or 'Category' columns. Please check your file.")
             st.stop()
 
+        # Optional columns that were actually found, resolved once
+        optional = {name: col for name, col in [("Payment", payment_col), ("Date", date_col)] if col is not None}
+
         # Clean Data
-        df_clean = df[[sales_col, category_col]].copy()
-        df_clean.dropna(inplace=True)
-        df_clean[sales_col] = pd.to_numeric(df_clean[sales_col], errors='coerce')
-        df_clean.dropna(inplace=True)
-        df_clean.columns = ["Sales", "Category"]
+        df_clean, total_sales, grouped = clean_data(upload_file.name, upload_file.getvalue(), sales_col, category_col)
+        total_sales_per_cat = grouped["sum"]
+        avg_sales_per_category = grouped["mean"]
 
         st.subheader("🔍 Preview of Cleaned Data")
         st.dataframe(df_clean.head(10))
 
         # Insights
         st.subheader("📈 Insights")
-        total_sales = df_clean["Sales"].sum()
-        avg_sales_per_category = df_clean.groupby("Category")["Sales"].mean()
         st.write(f"💰 **Total Sales**: ₹{total_sales:,.2f}")
+        top_category = None
         if not df_clean.empty:
-            top_category = df_clean.groupby("Category")["Sales"].sum().idxmax()
+            top_category = total_sales_per_cat.idxmax()
             st.write(f"🏆 **Top Category**: {top_category}")
         st.write("📊 **Average Sales per Category**:")
-        st.write(avg_sales_per_category)
+        # Only ship the first rows to the browser; the full table is sent only once toggled on
+        st.dataframe(avg_sales_per_category.head(MAX_TABLE_ROWS).reset_index(name="Sales"))
+        if len(avg_sales_per_category) > MAX_TABLE_ROWS:
+            if st.toggle(f"Show all {len(avg_sales_per_category)} categories"):
+                st.dataframe(avg_sales_per_category.reset_index(name="Sales"))
 
         # Charts
+        charts = {
+            "total": (total_sales_per_cat, "bar", "skyblue", "Total Sales by Category"),
+            "avg": (avg_sales_per_category, "bar", "orange", "Average Sales by Category"),
+        }
+
+        # Optional: Payment Method Pie
+        if "Payment" in optional:
+            payment_counts = df[optional["Payment"]].value_counts()
+            charts["payment"] = (payment_counts, "pie", None, None)
+
+        # Optional: Trend over days
+        if "Date" in optional:
+            dates = pd.to_datetime(df[optional["Date"]], errors="coerce")
+            # Count integer weekdays (Mon=0) directly; unparseable dates become -1 and are skipped
+            weekdays = dates.dt.weekday.to_numpy(dtype=np.int8, na_value=-1)
+            day_counts = pd.Series(
+                np.bincount(weekdays[weekdays >= 0], minlength=7),
+                index=WEEKDAYS,
+            )
+            charts["day"] = (day_counts, "bar", "green", "Sales Activity by Day of Week")
+
+        chart_pngs = render_charts(charts)
+
         st.subheader("📊 Sales by Category")
-        fig1, ax1 = plt.subplots()
-        df_clean.groupby("Category")["Sales"].sum().plot(kind="bar", ax=ax1, color="skyblue")
-        ax1.set_title("Total Sales by Category")
-        st.pyplot(fig1)
+        st.image(chart_pngs["total"])
 
         st.subheader("📊 Average Sales per Category")
-        fig2, ax2 = plt.subplots()
-        avg_sales_per_category.plot(kind="bar", ax=ax2, color="orange")
-        ax2.set_title("Average Sales by Category")
-        st.pyplot(fig2)
+        st.image(chart_pngs["avg"])
 
-        # Optional: Payment Method Pie
-        if payment_col and payment_col in df.columns:
+        if "payment" in chart_pngs:
             st.subheader("💳 Payment Method Distribution")
-            payment_counts = df[payment_col].value_counts()
-            fig3, ax3 = plt.subplots()
-            ax3.pie(payment_counts, labels=payment_counts.index, autopct="%1.1f%%", startangle=140)
-            ax3.axis("equal")
-            st.pyplot(fig3)
+            st.image(chart_pngs["payment"])
 
-        # Optional: Trend over days
-        if date_col and date_col in df.columns:
-            df[date_col] = pd.to_datetime(df[date_col], errors="coerce")
-            df["Day"] = df[date_col].dt.day_name()
+        if "day" in chart_pngs:
             st.subheader("📆 Most Active Days (by Order Count)")
-            day_counts = df["Day"].value_counts()
-            fig4, ax4 = plt.subplots()
-            day_counts.plot(kind="bar", ax=ax4, color="green")
-            ax4.set_title("Sales Activity by Day of Week")
-            st.pyplot(fig4)
+            st.image(chart_pngs["day"])
 
         # === PDF Report ===
-        def generate_pdf():
-            buffer = BytesIO()
-            c = canvas.Canvas(buffer, pagesize=letter)
-            width, height = letter
-
-            c.setFont("Helvetica-Bold", 18)
-            c.drawString(50, height - 50, "Smart Sales Report")
-
-            c.setFont("Helvetica", 12)
-            c.drawString(50, height - 100, f"Total Sales: ₹{total_sales:,.2f}")
-            if not df_clean.empty:
-                c.drawString(50, height - 120, f"Top Category: {top_category}")
-            c.drawString(50, height - 140, "Average Sales per Category:")
-
-            y = height - 160
-            for cat, val in avg_sales_per_category.items():
-                c.drawString(60, y, f"{cat}: ₹{val:,.2f}")
-                y -= 15
-
-            # Save chart to image
-            temp_chart = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
-            fig1.savefig(temp_chart.name, bbox_inches="tight")
-
-            # Add chart to PDF
-            c.drawImage(temp_chart.name, 50, 200, width=400, height=250)
-            c.showPage()
-            c.save()
-            buffer.seek(0)
-            return buffer
-
-        pdf = generate_pdf()
+        pdf = build_pdf(total_sales, top_category, tuple(avg_sales_per_category.items()), chart_pngs["total"])
         st.download_button("📥 Download PDF Report", data=pdf, file_name="sales_report.pdf", mime="application/pdf")
 
     except Exception as e: